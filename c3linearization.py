@@ -1,46 +1,79 @@
 """Simulation of MRO generation in Python since 2.3 (C3 linearization). For
    readability, class.__names__'s are used to represent the classes.
 """
+from collections import Counter
 from typing import Any
+from weakref import WeakKeyDictionary, ref
 
 
 def _merge(lists: list[list[Any]]) -> list[Any]:
     """Return C3 linearization or [] if inconsistent. """
-    _inconsistency_detected = False
-
-    def __merge(_lists: list[list[Any]]):
-        """Return C3 linearization or [] if inconsistent.
-        """
-        _result: list[Any] = []
-
-        nonlocal _inconsistency_detected
-        if _inconsistency_detected:
-            return _result
-
-        for lst in _lists:
-            if len(lst) and not any(lst[0] in any_list[1::]
-                                    for any_list in _lists
-                                    if any_list is not lst):
-                # we have a head that's not in any other list's tail.
-                _result = [_head := lst[0]]   # Append head of lst to result
-                for any_list in _lists:       # Remove head of lst in any lists
-                    if _head in any_list:
-                        any_list.remove(_head)
+    result: list[Any] = []
+    # The lists are not mutated: positions[i] is the index of the head of
+    # tuples[i], so removing a head just increments its position.
+    tuples = [tuple(lst) for lst in lists]
+    positions = [0] * len(tuples)
+    # Number of occurrences of each item in the tails of the lists, so a head
+    # can be checked without scanning all tails.
+    tail_counts = Counter(item for tpl in tuples for item in tpl[1::])
+
+    # lists not empty, more to merge.
+    while any(pos < len(tpl) for tpl, pos in zip(tuples, positions)):
+        for tpl, pos in zip(tuples, positions):
+            if pos < len(tpl) and not tail_counts[tpl[pos]]:
+                # we have a head that's not in any list's tail.
+                result.append(_head := tpl[pos])  # Append head to result
+                for i, any_tpl in enumerate(tuples):  # Remove head in any list
+                    # _head is in no tail, so it can only be a head.
+                    if positions[i] < len(any_tpl) and \
+                            any_tpl[positions[i]] == _head:
+                        positions[i] += 1
+                        # the new head (if any) is no longer in a tail.
+                        if positions[i] < len(any_tpl):
+                            tail_counts[any_tpl[positions[i]]] -= 1
                 break
         else:  # No break in for-loop, so nothing removed, so we're stuck!
-            _inconsistency_detected = True
-            return _result
+            return []
+
+    return result
+
+
+# Linearizations computed so far, as tuples (so the lists returned by mro can
+# be changed by the caller without affecting the cache), with the key they
+# are valid for (see _cache_key). Only weak references to classes are held,
+# so classes can still be garbage collected.
+_mro_cache: WeakKeyDictionary[Any, tuple[tuple[Any, ...], tuple[Any, ...]]] \
+    = WeakKeyDictionary()
 
-        if any(len(lst) for lst in _lists):  # lists not empty, more to merge.
-            _result += __merge(_lists)
 
-        return [] if _inconsistency_detected else _result
+def _cache_key(cls: Any) -> tuple[Any, ...]:
+    """Return what the linearization of cls depends on, apart from its
+       ancestors: the __name__ of cls and (weak references to) its
+       __bases__ with their __name__'s.
+    """
+    return (cls.__name__,
+            tuple((ref(base), base.__name__) for base in cls.__bases__))
 
-    return __merge(lists)
+
+def _is_cached(cls: Any, checked: set[Any]) -> bool:
+    """Return True if cls C3 linearization is cached and still valid, that is,
+       the __name__'s and __bases__ of cls and of its ancestors were not
+       reassigned since. checked holds the classes already found to be valid.
+    """
+    if cls in checked:
+        return True
+    if cls not in _mro_cache or _mro_cache[cls][0] != _cache_key(cls):
+        return False
+
+    checked.add(cls)
+    return all(_is_cached(base, checked) for base in cls.__bases__)
 
 
 def mro(cls: Any) -> list[Any]:
     """Return cls C3 linearization (or [] if inconsistent)."""
+    if _is_cached(cls, set()):
+        return list(_mro_cache[cls][1])
+
     expanded = [[cls.__name__]]
     bases_list = []
 
@@ -49,10 +82,13 @@ def mro(cls: Any) -> list[Any]:
         bases_list.append(base.__name__)
     expanded.append(bases_list)
 
-    return _merge(expanded)
+    result = _merge(expanded)
+    _mro_cache[cls] = (_cache_key(cls), tuple(result))
+    return result
 
 
 if __name__ == '__main__':
+    import gc
 
     def _get_python_mro(cls):
         """Return a list of all __name__'s of classes in cls's __mro__, that
@@ -134,9 +170,65 @@ if __name__ == '__main__':
         # mro (_merge will return [] in such cases).
         pass
 
+    def _test_cache():
+        """mro caches linearizations, but not forever."""
+        class O:
+            """class with object as its only base"""
+            pass
+
+        class A(O):
+            """class with O as its base"""
+            pass
+
+        class B(O):
+            """class with O as its base"""
+            pass
+
+        class C(A):
+            """class with A as its base"""
+            pass
+
+        class D(C):
+            """class with C as its base"""
+            pass
+
+        assert mro(D) == ['D', 'C', 'A', 'O', 'object']
+        assert _is_cached(D, set())
+        # A second call returns the cached result, and changing a returned
+        # list does not change the cache:
+        mro(D).append('X')
+        assert mro(D) == ['D', 'C', 'A', 'O', 'object']
+
+        # Reassigning the __bases__ of a class, or of one of its ancestors,
+        # invalidates the cache:
+        C.__bases__ = (B,)
+        assert not _is_cached(D, set())
+        assert mro(D) == _get_python_mro(D) == ['D', 'C', 'B', 'O', 'object']
+        C.__bases__ = (A,)
+        A.__bases__ = (B,)
+        assert mro(D) == _get_python_mro(D) == \
+               ['D', 'C', 'A', 'B', 'O', 'object']
+
+        # Renaming a class, or one of its ancestors, invalidates the cache:
+        A.__name__ = 'X'
+        assert not _is_cached(D, set())
+        assert mro(D) == _get_python_mro(D) == \
+               ['D', 'C', 'X', 'B', 'O', 'object']
+        D.__name__ = 'Y'
+        assert mro(D) == _get_python_mro(D) == \
+               ['Y', 'C', 'X', 'B', 'O', 'object']
+
+        # The cache does not keep classes alive:
+        class_refs = [ref(cls) for cls in (O, A, B, C, D)]
+        del O, A, B, C, D
+        gc.collect()
+        assert all(class_ref() is None for class_ref in class_refs)
+        print("test cache: ok")
+
     def _test_linearization():
         _test_simple()
         _test_complex()
+        _test_cache()
 
     # noinspection SpellCheckingInspection
     def _test_merge():
@@ -160,6 +252,14 @@ if __name__ == '__main__':
                                ['C', 'D', 'F', 'O'],
                                ['B', 'C']]) == \
                ['A', 'B', 'C', 'D', 'E', 'F', 'O']
+        # A head in its own list's tail cannot be taken either (as in C3):
+        assert _merge([['A', 'B', 'A']]) == []
+        # _merge does not change the lists it merges:
+        lists = [['A', 'X', 'O'], ['B', 'X', 'O'], ['A', 'B']]
+        assert _merge(lists) == ['A', 'B', 'X', 'O']
+        assert lists == [['A', 'X', 'O'], ['B', 'X', 'O'], ['A', 'B']]
+        # _merge is iterative, so long lists do not hit the recursion limit:
+        assert _merge([list(range(2000)), [0, 1]]) == list(range(2000))
         print("test merge: ok")
 
     _test_linearization()